@@ -8,6 +8,7 @@ import argparse
 import os
 import sys
 import functools
+from collections import defaultdict
 
 from utils import get_terms, split_equalities
 
@@ -32,18 +33,19 @@ class EGraph():
     class ENode:
         """
         Node of the graph
+
+        The graph stores its nodes as parallel arrays indexed by the node
+        id: an ENode is only a view of one entry of these arrays.
         """
 
-        def __init__(self, term, term_id, args):
+        def __init__(self, term, term_id, args, find):
             # Id of the
             self.id = term_id
             self.term = term
             # list of children nodes
             self.args = args
             # id for the equivalence class
-            self.find = term_id
-            # nodes for the parents
-            self.eq_parents = set()
+            self.find = find
 
         def get_name(self):
             if (self.term.is_function_application()):
@@ -61,85 +63,117 @@ class EGraph():
         """
         Create the DAG from the list of terms
         """
-        self.nodes = []
         self.term_to_id = {}  # Map from term to node ID
+
+        # Node attributes, indexed by the node ID
+        self.terms = []     # term of the node
+        self.func_id = []   # interned function symbol
+        self.args = []      # tuple of the children IDs
+        self.parent = []    # union-find parent
+        self.rank = []      # upper bound on the height of the class tree
+        self.class_size = []
+        # Parents of all the nodes in a class, indexed by the class root
+        self.parents = []
+
+        # Map from function name to its interned ID
+        self._fn_ids = {}
         
-        def get_depth(term):
-            """Calculate the depth/nesting level of a term"""
-            if not term.is_function_application():
-                return 0
-            if len(list(term.args())) == 0:
-                return 1
-            return 1 + max(get_depth(arg) for arg in term.args())
-        
-        # Sort terms by depth (process shallower terms first)
-        terms_list = list(terms)
-        terms_list.sort(key=get_depth)
-        
-        # Create nodes for all terms
-        for term in terms_list:
-            if term not in self.term_to_id:
-                # Get argument IDs if this is a function application
-                arg_ids = []
-                if term.is_function_application():
-                    for arg in term.args():
-                        if arg in self.term_to_id:
-                            arg_ids.append(self.term_to_id[arg])
-                        else:
-                            # Create node for argument if not exists
-                            arg_node_id = len(self.nodes)
-                            arg_node = self.ENode(arg, arg_node_id, [])
-                            self.nodes.append(arg_node)
-                            self.term_to_id[arg] = arg_node_id
-                            arg_ids.append(arg_node_id)
-                
-                # Create node for this term
-                node_id = len(self.nodes)
-                node = self.ENode(term, node_id, arg_ids)
-                self.nodes.append(node)
-                self.term_to_id[term] = node_id
-                
-                # Update parent references
-                for arg_id in arg_ids:
-                    self.nodes[arg_id].eq_parents.add(node_id)
+        # Create the nodes with a post-order traversal, so that the
+        # children of a term always exist before the term itself
+        for term in terms:
+            stack = [term]
+            while stack:
+                t = stack[-1]
+                if t in self.term_to_id:
+                    stack.pop()
+                    continue
+
+                args = t.args() if t.is_function_application() else ()
+                missing = [arg for arg in args if arg not in self.term_to_id]
+                if missing:
+                    stack.extend(missing)
+                else:
+                    stack.pop()
+                    arg_ids = tuple(self.term_to_id[arg] for arg in args)
+                    self._add_node(t, arg_ids)
+
+        # Nodes whose class was modified by _union_only since the last
+        # call to _saturate_congruence
+        self._dirty = []
+
+    def _add_node(self, term, arg_ids):
+        """
+        Append a node for term with children arg_ids and returns its id
+        """
+        node_id = len(self.terms)
+        if term.is_function_application():
+            name = term.function_name()
+            fid = self._fn_ids.setdefault(name, len(self._fn_ids))
+        else:
+            # Variables get a unique negative id
+            fid = -node_id - 1
+
+        self.terms.append(term)
+        self.func_id.append(fid)
+        self.args.append(arg_ids)
+        self.parent.append(node_id)
+        self.rank.append(0)
+        self.class_size.append(1)
+        self.parents.append(set())
+        self.term_to_id[term] = node_id
+
+        # Update parent references
+        for arg_id in arg_ids:
+            self.parents[arg_id].add(node_id)
+        return node_id
 
     def node(self, node_id):
         """
         Returns the node with id equal to node_id
         """
-        return self.nodes[node_id]
+        return self.ENode(self.terms[node_id], node_id,
+                          self.args[node_id], self.parent[node_id])
 
     def find(self, node_id):
         """
-        Returns the representative of the equivalence class (with path compression)
+        Returns the representative of the equivalence class (with path halving)
         """
-        node = self.nodes[node_id]
-        if node.find != node_id:
-            # Path compression
-            node.find = self.find(node.find)
-        return node.find
+        parent = self.parent
+        while parent[node_id] != node_id:
+            # Path halving: point the node to its grandparent
+            parent[node_id] = parent[parent[node_id]]
+            node_id = parent[node_id]
+        return node_id
 
     def union(self, id1, id2):
         """
         Returns the union of two equivalence classes.
-        id2 becomes the representative of the class.
+        The root of the class with the highest rank becomes the
+        representative of the class (id2 on ties).
         """
         root1 = self.find(id1)
         root2 = self.find(id2)
         
         if root1 != root2:
-            # Make root2 the representative
-            self.nodes[root1].find = root2
+            # Attach the shorter tree under the taller one
+            if self.rank[root1] > self.rank[root2]:
+                root1, root2 = root2, root1
+            elif self.rank[root1] == self.rank[root2]:
+                self.rank[root2] += 1
+            self.parent[root1] = root2
+            self.class_size[root2] += self.class_size[root1]
+            # Merge the smaller parent set into the larger one, in place
+            parents1 = self.parents[root1]
+            parents2 = self.parents[root2]
+            if len(parents1) > len(parents2):
+                parents1, parents2 = parents2, parents1
+            parents2 |= parents1
+            self.parents[root2] = parents2
+            self.parents[root1] = None
 
     def get_parents(self, node_id):
         """ Get the parents of all nodes in node_id congruence class """
-        parents = set()
-        # Find all nodes in the same equivalence class
-        root = self.find(node_id)
-        for node in self.nodes:
-            if self.find(node.id) == root:
-                parents.update(node.eq_parents)
-        return parents
+        return self.parents[self.find(node_id)]
 
     def congruent(self, id1, id2):
         """
@@ -148,71 +182,102 @@ class EGraph():
         1. They have the same function symbol
         2. Their corresponding arguments are in the same equivalence classes
         """
-        node1 = self.nodes[id1]
-        node2 = self.nodes[id2]
-        
-        # Check if both are function applications
-        if not (node1.term.is_function_application() and node2.term.is_function_application()):
-            return False
-        
-        # Check if they have the same function name
-        if node1.get_name() != node2.get_name():
-            return False
-        
-        # Check if they have the same number of arguments
-        if len(node1.args) != len(node2.args):
-            return False
-        
-        # Check if corresponding arguments are in the same equivalence class
-        for arg1_id, arg2_id in zip(node1.args, node2.args):
-            if self.find(arg1_id) != self.find(arg2_id):
-                return False
-        
-        return True
+        return self.signature(id1) == self.signature(id2)
+
+    def signature(self, node_id):
+        """
+        Returns the signature of node_id, i.e. its function symbol id and
+        the representatives of its arguments
+        """
+        return (self.func_id[node_id],
+                tuple(self.find(a) for a in self.args[node_id]))
 
     def merge(self, id1, id2):
         """
         Merge the congruence class of id1 and id2
         """
-        # If already in same class, nothing to do
-        if self.find(id1) == self.find(id2):
-            return
-        
-        # Get parents before merging
-        parents1 = self.get_parents(id1)
-        parents2 = self.get_parents(id2)
-        
-        # Merge the two equivalence classes
-        self.union(id1, id2)
-        
-        # Combine all parents
-        all_parents = parents1 | parents2
-        
-        # Check all pairs of parents for congruence
-        parents_list = list(all_parents)
-        for i in range(len(parents_list)):
-            for j in range(i + 1, len(parents_list)):
-                p1 = parents_list[i]
-                p2 = parents_list[j]
-                # If parents are congruent and not already in same class
-                if self.find(p1) != self.find(p2) and self.congruent(p1, p2):
-                    # Recursively merge congruent parents
-                    self.merge(p1, p2)
-
-    def merge_equalities(self, equalities):
+        self._union_only(id1, id2)
+        self._saturate_congruence()
+
+    def _union_only(self, id1, id2):
         """
-        Merge a list of equalities
+        Merge the classes of id1 and id2 without propagating the
+        congruences (see _saturate_congruence)
         """
-        for eq in equalities:
-            # Get left and right sides of equality
-            lhs = eq.args()[0]
-            rhs = eq.args()[1]
-            
+        if self.find(id1) != self.find(id2):
+            self.union(id1, id2)
+            self._dirty.append(id1)
+
+    def _saturate_congruence(self):
+        """
+        Merge the congruent parents of the classes modified by
+        _union_only until the signatures are stable
+        """
+        # Signature table, reused for all the rounds
+        sig_table = {}
+        while self._dirty:
+            # Collect the parents of all the modified classes at once (each
+            # class only once: many modified nodes share the same root)
+            candidates = set()
+            for root in {self.find(node_id) for node_id in self._dirty}:
+                candidates |= self.parents[root]
+            self._dirty.clear()
+
+            # Bucket the parents by signature: two parents are congruent
+            # iff they have the same function symbol and arguments classes.
+            # The classes merged here are scanned again in the next round.
+            sig_table.clear()
+            for p in candidates:
+                sig = self.signature(p)
+                if sig in sig_table:
+                    q = sig_table[sig]
+                    if self.find(p) != self.find(q):
+                        assert self.congruent(p, q)
+                        self._union_only(p, q)
+                else:
+                    sig_table[sig] = p
+
+    def atom_ids(self, atoms):
+        """
+        Returns the list of (lhs id, rhs id) pairs of the equality atoms
+        whose both sides are nodes of the graph
+        """
+        term_to_id = self.term_to_id
+        pairs = []
+        for atom in atoms:
+            # Get left and right sides of the atom
+            (lhs, rhs) = atom.args()
+
             # Find node IDs
-            if lhs in self.term_to_id and rhs in self.term_to_id:
-                lhs_id = self.term_to_id[lhs]
-                rhs_id = self.term_to_id[rhs]
-                self.merge(lhs_id, rhs_id)
+            lhs_id = term_to_id.get(lhs)
+            if lhs_id is None:
+                continue
+            rhs_id = term_to_id.get(rhs)
+            if rhs_id is None:
+                continue
+            pairs.append((lhs_id, rhs_id))
+        return pairs
+
+    def merge_equalities(self, equalities, ineq_pairs=None):
+        """
+        Merge a list of equalities
+
+        If ineq_pairs (a list of (lhs id, rhs id) pairs, see atom_ids) is
+        given, the inequalities are checked after the unions and, if none
+        is violated yet, after the congruence propagation.
+
+        Returns False if an inequality was violated and True otherwise.
+        """
+        # Union all the equalities first: the classes only grow, so a
+        # violated inequality is already a conflict at this point
+        for lhs_id, rhs_id in self.atom_ids(equalities):
+            self._union_only(lhs_id, rhs_id)
+        if ineq_pairs and not self.consistent(ineq_pairs):
+            return False
+
+        # Then propagate the congruences in a single pass
+        self._saturate_congruence()
+        return not ineq_pairs or self.consistent(ineq_pairs)
 
     def check_consistency(self, inequalities):
         """
@@ -220,27 +285,25 @@ class EGraph():
 
         Note: you need to merge all the equalities before calling this function
         """
-        for ineq in inequalities:
-            # Get left and right sides of inequality
-            lhs = ineq.args()[0]
-            rhs = ineq.args()[1]
-            
-            # Find node IDs
-            if lhs in self.term_to_id and rhs in self.term_to_id:
-                lhs_id = self.term_to_id[lhs]
-                rhs_id = self.term_to_id[rhs]
-                
-                # If they are in the same equivalence class, we have a conflict
-                if self.find(lhs_id) == self.find(rhs_id):
-                    return False  # Inconsistent
-        
+        return self.consistent(self.atom_ids(inequalities))
+
+    def consistent(self, ineq_pairs):
+        """
+        Check if any inequality in the list of (lhs id, rhs id) pairs
+        ineq_pairs is not consistent
+        """
+        for lhs_id, rhs_id in ineq_pairs:
+            # If they are in the same equivalence class, we have a conflict
+            if self.find(lhs_id) == self.find(rhs_id):
+                return False  # Inconsistent
+
         return True  # Consistent
 
     def print_graph(self):
         """ Print the nodes of the graph
         """
-        for n in self.nodes:
-            print(n)
+        for node_id in range(len(self.terms)):
+            print(self.node(node_id))
 
     def print_eq_class(self, ostream = None):
         """ Prints the current equivalence class
@@ -249,17 +312,13 @@ class EGraph():
         if ostream is None:
             ostream = sys.stdout
 
-        eq_class = {}
-        for n in self.nodes:
-            eq_set = set()
-            if n.find in eq_class:
-                eq_set = eq_class[n.find]
-            else:
-                eq_class[n.find] = eq_set
-            eq_set.add(n)
+        # Group the terms by class representative (each node appears once)
+        eq_class = defaultdict(list)
+        for node_id, term in enumerate(self.terms):
+            eq_class[self.find(node_id)].append(term)
 
-        for (nodeid, nodes) in eq_class.items():
-            ostream.write("{%s} " % ",".join([idn.term.serialize() for idn in nodes]))
+        for (nodeid, terms) in eq_class.items():
+            ostream.write("{%s} " % ",".join([t.serialize() for t in terms]))
         ostream.write("\n")
 
 
@@ -280,15 +339,73 @@ def euf_solver(formula):
     # Construct the graph
     graph = EGraph(terms)
     
-    # Compute the congruence closure by merging all equalities
-    graph.merge_equalities(equalities)
-    
-    # Check if the terms in the inequalities end up in the same congruence class
-    is_consistent = graph.check_consistency(inequalities)
+    # Resolve the inequalities to node ids once
+    ineq_pairs = graph.atom_ids(inequalities)
+
+    # Compute the congruence closure by merging all equalities and check if
+    # the terms in the inequalities end up in the same congruence class
+    is_consistent = graph.merge_equalities(equalities, ineq_pairs)
 
     return is_consistent
 
 
+def euf_conflict(pos_atoms, neg_atoms):
+    """
+    Check the conjunction of the equality atoms in the list pos_atoms
+    and of the negation of the atoms in the list neg_atoms.
+
+    Returns None if the conjunction is satisfiable. Otherwise, returns a
+    pair (core_pos, core_neg) of lists of atoms taken from pos_atoms and
+    neg_atoms whose conjunction is already unsatisfiable.
+    """
+    terms = set()
+    for atom in pos_atoms + neg_atoms:
+        terms.update(get_terms(atom))
+
+    def violated_inequality(k):
+        """
+        Returns an atom of neg_atoms violated by the congruence closure of
+        the first k atoms of pos_atoms, or None
+        """
+        # Construct the graph
+        graph = EGraph(terms)
+
+        def node_ids(atom):
+            # Both sides are in the graph: a missing one raises a KeyError
+            (lhs, rhs) = atom.args()
+            return (graph.term_to_id[lhs], graph.term_to_id[rhs])
+
+        # Union all the equalities, then propagate the congruences once
+        for atom in pos_atoms[:k]:
+            graph._union_only(*node_ids(atom))
+        graph._saturate_congruence()
+
+        for atom in neg_atoms:
+            (lhs_id, rhs_id) = node_ids(atom)
+            if graph.find(lhs_id) == graph.find(rhs_id):
+                return atom
+        return None
+
+    conflict = violated_inequality(len(pos_atoms))
+    if conflict is None:
+        return None
+
+    # Binary search the shortest prefix of pos_atoms whose closure violates
+    # an inequality: this prefix and the inequality form the core
+    lo = 0
+    hi = len(pos_atoms)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        violated = violated_inequality(mid)
+        if violated is None:
+            lo = mid + 1
+        else:
+            hi = mid
+            conflict = violated
+
+    return (pos_atoms[:hi], [conflict])
+
+
 def lazy_smt_solver(formula):
     """
     Lazy offline SMT solver for the Theory of Equality.
@@ -296,9 +413,9 @@ def lazy_smt_solver(formula):
     This solver works by:
     1. Creating a boolean abstraction of the formula (map equality atoms to boolean variables)
     2. Enumerating boolean models using a SAT solver
-    3. For each boolean model, convert it back to theory literals and check with euf_solver
+    3. For each boolean model, convert it back to theory literals and check with euf_conflict
     4. If a model is theory-consistent, return SAT
-    5. If a model is theory-inconsistent, block it and try the next one
+    5. If a model is theory-inconsistent, block the conflicting literals and try the next model
     6. If all models are exhausted, return UNSAT
     
     Args:
@@ -308,16 +425,12 @@ def lazy_smt_solver(formula):
         True if satisfiable, False otherwise
     """
     # Extract all equality atoms from the formula
-    atoms = get_atoms(formula)
+    atoms = list(get_atoms(formula))
     
     # Create boolean abstraction: map each atom to a fresh boolean variable
-    atom_to_bool = {}
-    bool_to_atom = {}
-    
-    for i, atom in enumerate(atoms):
-        bool_var = Symbol(f"b_{i}", BOOL)
-        atom_to_bool[atom] = bool_var
-        bool_to_atom[bool_var] = atom
+    # (bool_vars[i] is the variable of atoms[i])
+    bool_vars = [Symbol(f"b_{i}", BOOL) for i in range(len(atoms))]
+    atom_to_bool = dict(zip(atoms, bool_vars))
     
     # Substitute atoms with boolean variables to get boolean abstraction
     bool_formula = formula.substitute(atom_to_bool)
@@ -332,41 +445,29 @@ def lazy_smt_solver(formula):
         model = sat_solver.get_model()
         
         # Convert boolean model back to theory literals
-        theory_literals = []
-        for bool_var, atom in bool_to_atom.items():
-            bool_value = model.get_value(bool_var)
-            if bool_value.is_true():
-                theory_literals.append(atom)
+        pos_atoms = []
+        neg_atoms = []
+        for i, bool_var in enumerate(bool_vars):
+            if model.get_value(bool_var).is_true():
+                pos_atoms.append(atoms[i])
             else:
-                theory_literals.append(Not(atom))
-        
-        # Create conjunction of theory literals
-        if len(theory_literals) == 0:
-            theory_formula = TRUE()
-        elif len(theory_literals) == 1:
-            theory_formula = theory_literals[0]
-        else:
-            theory_formula = And(theory_literals)
+                neg_atoms.append(atoms[i])
         
         # Check theory consistency with EUF solver
-        is_theory_sat = euf_solver(theory_formula)
+        conflict = euf_conflict(pos_atoms, neg_atoms)
         
-        if is_theory_sat:
+        if conflict is None:
             # Found a satisfying assignment
             return True
         else:
-            # Block this model by adding the negation of the current assignment
-            blocking_clause = []
-            for bool_var, atom in bool_to_atom.items():
-                bool_value = model.get_value(bool_var)
-                if bool_value.is_true():
-                    blocking_clause.append(Not(bool_var))
-                else:
-                    blocking_clause.append(bool_var)
+            # Block the literals of the conflict: this blocks the current
+            # assignment and every other assignment containing the conflict
+            (core_pos, core_neg) = conflict
+            blocking_clause = [Not(atom_to_bool[atom]) for atom in core_pos]
+            blocking_clause.extend(atom_to_bool[atom] for atom in core_neg)
             
             # Add blocking clause to prevent this assignment from being generated again
-            if len(blocking_clause) > 0:
-                sat_solver.add_assertion(Or(blocking_clause))
+            sat_solver.add_assertion(Or(blocking_clause))
     
     # No satisfying assignment found
     return False
@@ -0,0 +1,17 @@
+(set-logic QF_UF)
+
+(declare-sort MySort 0)
+(declare-fun a () MySort)
+(declare-fun b () MySort)
+(declare-fun c () MySort)
+(declare-fun f (MySort) MySort)
+(declare-fun g (MySort) MySort)
+
+(assert
+    (and
+      (or (= a b) (= b c))
+      (not (= a c))
+    )
+)
+
+(check-sat)
@@ -0,0 +1,18 @@
+(set-logic QF_UF)
+
+(declare-sort MySort 0)
+(declare-fun a () MySort)
+(declare-fun b () MySort)
+(declare-fun c () MySort)
+(declare-fun f (MySort) MySort)
+(declare-fun g (MySort) MySort)
+
+(assert
+    (and
+      (or (= a b) (= (f a) c))
+      (not (= (f b) (f a)))
+      (not (= c (f a)))
+    )
+)
+
+(check-sat)
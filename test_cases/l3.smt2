@@ -0,0 +1,18 @@
+(set-logic QF_UF)
+
+(declare-sort MySort 0)
+(declare-fun a () MySort)
+(declare-fun b () MySort)
+(declare-fun c () MySort)
+(declare-fun f (MySort) MySort)
+(declare-fun g (MySort) MySort)
+
+(assert
+    (and
+      (=> (= a b) (= (f a) (g b)))
+      (= a b)
+      (not (= (f b) (g a)))
+    )
+)
+
+(check-sat)
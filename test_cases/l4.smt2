@@ -0,0 +1,20 @@
+(set-logic QF_UF)
+
+(declare-sort MySort 0)
+(declare-fun a () MySort)
+(declare-fun b () MySort)
+(declare-fun c () MySort)
+(declare-fun f (MySort) MySort)
+(declare-fun g (MySort) MySort)
+
+(assert
+    (and
+      (or (= a b) (= b c) (= a c))
+      (or (not (= a b)) (= (f a) c))
+      (or (not (= b c)) (= (g b) a))
+      (not (= (f b) c))
+      (not (= (g c) a))
+    )
+)
+
+(check-sat)
@@ -0,0 +1,18 @@
+(set-logic QF_UF)
+
+(declare-sort MySort 0)
+(declare-fun a () MySort)
+(declare-fun b () MySort)
+(declare-fun c () MySort)
+(declare-fun f (MySort) MySort)
+(declare-fun g (MySort) MySort)
+
+(assert
+    (or
+      (and (= a b) (not (= (f a) (f b))))
+      (and (= (f a) b) (= (f b) c) (not (= (f (f a)) c)))
+      (and (= (g a) a) (not (= (g (g a)) a)) (= b c))
+    )
+)
+
+(check-sat)
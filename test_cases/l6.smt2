@@ -0,0 +1,21 @@
+(set-logic QF_UF)
+
+(declare-sort MySort 0)
+(declare-fun a () MySort)
+(declare-fun b () MySort)
+(declare-fun c () MySort)
+(declare-fun d () MySort)
+(declare-fun f (MySort) MySort)
+(declare-fun g (MySort) MySort)
+
+(assert
+    (and
+      (= a b)
+      (not (= a c))
+      (or (= b c) (= c d))
+      (or (= (f a) (f c)) (= (f b) d))
+      (not (= (f d) (f a)))
+    )
+)
+
+(check-sat)
@@ -33,13 +33,10 @@ def get_terms(formula):
         term = terms_to_visit.pop()
         terms.add(term)
         if term.is_function_application():
-            function_params = []
             function_name = term.function_name()
-            for elem in term.args():
-                function_params.append(elem)
             assert not function_name is None
 
-            for t in function_params:
+            for t in term.args():
                 if not t in terms:
                     terms_to_visit.append(t)
     return terms